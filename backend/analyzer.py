@@ -1,12 +1,13 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Tuple
 import jieba
 import re
 import math
 from collections import Counter
 from config import Config
+from jit import njit
 
 # 尝试导入lz4
 try:
@@ -19,7 +20,85 @@ except ImportError:
     print("⚠ LZ4未安装，部分压缩消息可能无法完整解析")
 
 
+# =========================
+# 逐条消息的数值内核（输入为 numpy 数组）
+# =========================
+@njit(cache=True)
+def _response_times_kernel(ts, senders, limit):
+    """
+    前 limit 条消息中，发送方切换处的响应间隔（秒）
+    间隔按 Timedelta.seconds 语义取一天内的秒数，只保留 (0, 3600) 之间的值
+    """
+    n = min(ts.shape[0], limit)
+    out = np.empty(max(n - 1, 0), dtype=np.int64)
+    k = 0
+    for i in range(1, n):
+        if senders[i] != senders[i - 1]:
+            diff = (ts[i] - ts[i - 1]) % 86400
+            if 0 < diff < 3600:
+                out[k] = diff
+                k += 1
+    return out[:k]
+
+
+@njit(cache=True)
+def _max_streak_kernel(days, max_gap):
+    """days 为升序去重的日序号，相邻间隔 <= max_gap 视为连续，返回 (最长连续天数, 起始下标)"""
+    best = 1
+    best_start = 0
+    current = 1
+    for i in range(1, days.shape[0]):
+        if days[i] - days[i - 1] <= max_gap:
+            current += 1
+            if current > best:
+                best = current
+                best_start = i - current + 1
+        else:
+            current = 1
+    return best, best_start
+
+
+@njit(cache=True)
+def _chain_count_kernel(senders, limit):
+    """前 limit 条消息中，同一发送方连续第 3 条及以后的消息数"""
+    n = min(senders.shape[0], limit)
+    chains = 0
+    length = 0
+    for i in range(n):
+        if i > 0 and senders[i] == senders[i - 1]:
+            length += 1
+            if length >= 3:
+                chains += 1
+        else:
+            length = 1
+    return chains
+
+
+def _epoch_seconds(times: pd.Series) -> np.ndarray:
+    """datetime 列 -> int64 秒级时间戳数组"""
+    return times.to_numpy().astype('datetime64[s]').astype(np.int64)
+
+
+def _epoch_days(times: pd.Series) -> np.ndarray:
+    """datetime 列 -> 升序去重的 int64 日序号数组"""
+    return np.unique(times.to_numpy().astype('datetime64[D]').astype(np.int64))
+
+
 class RelationAnalyzer:
+    # 维度分数行的固定顺序
+    DIMENSION_KEYS = ("interaction", "content", "emotion", "depth")
+    # 评分读取的消息列（CompressContent 仅在 Type=49 & SubType=57 的引用消息上解压）
+    INPUT_COLUMNS = ("CreateTime", "IsSender", "Type", "SubType", "StrContent", "CompressContent")
+    # statistics 的固定字段与缺省值：所有返回路径都包含全部字段，调用方可直接按键访问
+    EMPTY_STATISTICS = {
+        'total_messages': 0,
+        'total_days': 0,
+        'sent_messages': 0,
+        'received_messages': 0,
+        'first_chat_date': '',
+        'last_chat_date': ''
+    }
+
     def __init__(self):
         self.config = Config()
 
@@ -90,15 +169,22 @@ class RelationAnalyzer:
 
     def calculate_rscore(self, messages_df: pd.DataFrame) -> Dict:
         """计算关系评分 - 包含新鲜度调整"""
+        return self.calculate_rscore_with_row(messages_df)[0]
+
+    def calculate_rscore_with_row(self, messages_df: pd.DataFrame) -> Tuple[Dict, np.ndarray]:
+        """
+        计算关系评分，同时返回按 DIMENSION_KEYS 排列的维度分数行 (4,)
+        批量分析可直接写入维度矩阵，无需再逐键读取 result['dimensions']
+        """
         if messages_df.empty:
-            return self._empty_result()
+            return self._empty_result(), np.zeros(len(self.DIMENSION_KEYS))
 
         try:
             # 预处理数据
             messages_df = self._preprocess_messages(messages_df)
 
             if messages_df.empty:
-                return self._empty_result()
+                return self._empty_result(), np.zeros(len(self.DIMENSION_KEYS))
 
             # 计算基础统计
             stats = self._calculate_statistics(messages_df)
@@ -151,14 +237,17 @@ class RelationAnalyzer:
             # 提取里程碑
             milestones = self._extract_milestones(messages_df)
 
+            # 维度分数（与 DIMENSION_KEYS 顺序一致）
+            dim_values = (
+                round(interaction_score['total'] * 10, 2),
+                round(content_score['total'] * 10, 2),
+                round(emotion_score['total'] * 10, 2),
+                round(depth_score['total'] * 10, 2)
+            )
+
             return {
                 "total_score": round(final_score, 2),
-                "dimensions": {
-                    "interaction": round(interaction_score['total'] * 10, 2),
-                    "content": round(content_score['total'] * 10, 2),
-                    "emotion": round(emotion_score['total'] * 10, 2),
-                    "depth": round(depth_score['total'] * 10, 2)
-                },
+                "dimensions": dict(zip(self.DIMENSION_KEYS, dim_values)),
                 "details": {
                     "interaction": interaction_score['details'],
                     "content": content_score['details'],
@@ -174,10 +263,10 @@ class RelationAnalyzer:
                 "statistics": stats,
                 "relationship_status": relationship_status,
                 "freshness": round(freshness, 2)
-            }
+            }, np.array(dim_values)
         except Exception as e:
             print(f"计算评分时出错: {e}")
-            return self._empty_result()
+            return self._empty_result(), np.zeros(len(self.DIMENSION_KEYS))
 
     def _calculate_maturity(self, df: pd.DataFrame, stats: Dict) -> float:
         """计算关系成熟度（0-1）"""
@@ -220,17 +309,9 @@ class RelationAnalyzer:
             active_days = df.groupby(df['CreateTime'].dt.date).size().shape[0]
             active_ratio = active_days / max(stats['total_days'], 1)
 
-            # 计算最长连续天数
-            dates = sorted(df['CreateTime'].dt.date.unique())
-            max_streak = 1
-            current_streak = 1
-
-            for i in range(1, len(dates)):
-                if (dates[i] - dates[i - 1]).days <= 2:
-                    current_streak += 1
-                    max_streak = max(max_streak, current_streak)
-                else:
-                    current_streak = 1
+            # 计算最长连续天数（间隔不超过2天视为连续）
+            max_streak, _ = _max_streak_kernel(_epoch_days(df['CreateTime']), 2)
+            max_streak = int(max_streak)
 
             # 持续性评分
             continuity_score = active_ratio * 0.5 + min(max_streak / 30, 1.0) * 0.5
@@ -249,15 +330,12 @@ class RelationAnalyzer:
             else:
                 balance = 0
 
-            # 计算平均响应时间
-            response_times = []
-            for i in range(1, min(len(df), 500)):
-                if df.iloc[i]['IsSender'] != df.iloc[i - 1]['IsSender']:
-                    time_diff = (df.iloc[i]['CreateTime'] - df.iloc[i - 1]['CreateTime']).seconds
-                    if 0 < time_diff < 3600:
-                        response_times.append(time_diff)
+            # 计算平均响应时间（前500条消息）
+            response_times = _response_times_kernel(
+                _epoch_seconds(df['CreateTime']), df['IsSender'].to_numpy(dtype=np.int64), 500
+            )
 
-            if response_times:
+            if len(response_times) > 0:
                 avg_response = np.median(response_times)
                 response_score = self._logarithmic_scale(300 / max(avg_response, 60), 1, 2)
             else:
@@ -475,18 +553,7 @@ class RelationAnalyzer:
                 long_msg_ratio = long_messages / len(text_messages)
 
                 # 计算对话连续性（连续多条消息）
-                conversation_chains = 0
-                last_sender = None
-                chain_length = 0
-
-                for sender in df['IsSender'].values[:1000]:
-                    if sender == last_sender:
-                        chain_length += 1
-                        if chain_length >= 3:
-                            conversation_chains += 1
-                    else:
-                        chain_length = 1
-                        last_sender = sender
+                conversation_chains = int(_chain_count_kernel(df['IsSender'].to_numpy(dtype=np.int64), 1000))
 
                 chain_ratio = conversation_chains / min(len(df), 1000)
 
@@ -550,14 +617,7 @@ class RelationAnalyzer:
             },
             "details": {},
             "milestones": [],
-            "statistics": {
-                'total_messages': 0,
-                'total_days': 0,
-                'sent_messages': 0,
-                'received_messages': 0,
-                'first_chat_date': '',
-                'last_chat_date': ''
-            },
+            "statistics": dict(self.EMPTY_STATISTICS),
             "relationship_status": "未知",
             "freshness": 0.0
         }
@@ -565,8 +625,11 @@ class RelationAnalyzer:
     def _preprocess_messages(self, df: pd.DataFrame) -> pd.DataFrame:
         """预处理消息数据"""
         try:
-            # 转换时间戳
-            df['CreateTime'] = pd.to_datetime(df['CreateTime'], unit='s', errors='coerce')
+            # 转换时间戳：已是 datetime 时不再重复解析；用 assign 生成新表，不修改调用方传入的 DataFrame
+            create_time = df['CreateTime']
+            if not np.issubdtype(create_time.dtype, np.datetime64):
+                create_time = pd.to_datetime(create_time, unit='s', errors='coerce')
+            df = df.assign(CreateTime=create_time)
 
             # 移除无效时间戳的行
             df = df.dropna(subset=['CreateTime'])
@@ -625,25 +688,15 @@ class RelationAnalyzer:
                 })
 
             # 3. 最长连续对话
-            dates = sorted(df['CreateTime'].dt.date.unique())
-            max_streak = 1
-            current_streak = 1
-            streak_start = dates[0] if dates else None
-
-            for i in range(1, len(dates)):
-                if (dates[i] - dates[i - 1]).days <= 1:
-                    current_streak += 1
-                    if current_streak > max_streak:
-                        max_streak = current_streak
-                        streak_end = dates[i]
-                        streak_start = dates[i - current_streak + 1]
-                else:
-                    current_streak = 1
-
-            if max_streak >= 7 and streak_start:
+            days = _epoch_days(df['CreateTime'])
+            max_streak, start_idx = _max_streak_kernel(days, 1)
+            max_streak = int(max_streak)
+
+            if max_streak >= 7:
+                streak_start = np.datetime64(int(days[start_idx]), 'D')
                 milestones.append({
                     'type': 'streak',
-                    'date': streak_start.strftime('%Y-%m-%d'),
+                    'date': str(streak_start),
                     'description': f'最长连续聊天',
                     'content': f'连续 {max_streak} 天保持联系'
                 })
@@ -682,14 +735,7 @@ class RelationAnalyzer:
     def _calculate_statistics(self, df: pd.DataFrame) -> Dict:
         """计算统计数据"""
         if df.empty:
-            return {
-                'total_messages': 0,
-                'total_days': 0,
-                'sent_messages': 0,
-                'received_messages': 0,
-                'first_chat_date': '',
-                'last_chat_date': ''
-            }
+            return dict(self.EMPTY_STATISTICS)
 
         try:
             return {
@@ -702,11 +748,4 @@ class RelationAnalyzer:
             }
         except Exception as e:
             print(f"计算统计数据时出错: {e}")
-            return {
-                'total_messages': int(len(df)),
-                'total_days': 0,
-                'sent_messages': 0,
-                'received_messages': 0,
-                'first_chat_date': '',
-                'last_chat_date': ''
-            }
\ No newline at end of file
+            return {**self.EMPTY_STATISTICS, 'total_messages': int(len(df))}
\ No newline at end of file
@@ -1,20 +1,46 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import asyncio
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import queue
+import threading
+import time
 import uvicorn
 import numpy as np
-from collections import defaultdict
+from collections import OrderedDict
 import calendar
 import pandas as pd
-import re
+import orjson
 
 from database import WeChatDB
 from analyzer import RelationAnalyzer
+from jit import njit
 from config import Config
 
-app = FastAPI(title="RScore API", version="1.0.0")
+
+_ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+class NumpyORJSONResponse(ORJSONResponse):
+    """
+    orjson 序列化：直接支持 numpy 标量/数组，以及 yearly_summary 等非字符串键。
+    路由需直接返回该响应对象；返回普通 dict 时 FastAPI 会先用 jsonable_encoder 遍历整棵结果树
+    """
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=_ORJSON_OPTIONS)
+
+
+app = FastAPI(title="RScore API", version="1.0.0", default_response_class=NumpyORJSONResponse)
 
 # 配置CORS
 app.add_middleware(
@@ -25,20 +51,50 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 日志：处理器挂在 QueueListener 后台线程上，业务线程只做无阻塞的入队
+logger = logging.getLogger(__name__)
+_log_queue: "queue.SimpleQueue" = queue.SimpleQueue()
+_log_listener = logging.handlers.QueueListener(_log_queue, logging.StreamHandler())
+logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+logger.setLevel(Config.LOG_LEVEL)
+logger.propagate = False
+
 # 全局变量
 db: Optional[WeChatDB] = None
 analyzer: Optional[RelationAnalyzer] = None
 config: Optional[Config] = None
+executor: Optional[ThreadPoolExecutor] = None
+process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_lock = threading.Lock()
+
+
+# 子进程启动方式：不用 fork（批量分析时池在工作线程中首次 submit 才拉起子进程，此时进程内有多个线程，
+# fork 可能继承被占用的锁而死锁）；优先 forkserver，Windows 等不支持的平台用 spawn
+_POOL_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+
+def _new_process_pool() -> ProcessPoolExecutor:
+    """评分进程池（启动与损坏后重建共用）"""
+    return ProcessPoolExecutor(max_workers=os.cpu_count(), mp_context=multiprocessing.get_context(_POOL_START_METHOD))
 
 
 @app.on_event("startup")
 async def startup_event():
     """启动时初始化"""
-    global db, analyzer, config
+    global db, analyzer, config, executor, process_pool
+    _log_listener.start()
     db = WeChatDB()
+    db.warm_up()
     analyzer = RelationAnalyzer()
     config = Config()
-    print("RScore API 启动成功！")
+    # 批量分析用线程池：SQLite 读取与评分计算可重叠执行；线程数即同时在途的联系人数上限，
+    # 作用等同于信号量，无需再额外包一层 asyncio.Semaphore
+    executor = ThreadPoolExecutor(max_workers=Config.BATCH_CONCURRENCY)
+    # 预热时间聚合内核（首次调用触发 JIT 编译或加载缓存）
+    analyze_time_patterns(*(np.zeros(1, dtype=dtype) for dtype in _TIME_COLUMN_DTYPES))
+    # 评分计算为 CPU 密集型，放到进程池绕开 GIL；线程池负责读取与调度
+    process_pool = _new_process_pool()
+    logger.info("RScore API 启动成功！")
 
 
 # =========================
@@ -72,39 +128,82 @@ class RScoreResponse(BaseModel):
 # =========================
 # 互动模式分析 & 成就计算（新增）
 # =========================
-_EMOJI_RE = re.compile(
-    r"["
-    r"\U0001F300-\U0001F5FF"
-    r"\U0001F600-\U0001F64F"
-    r"\U0001F680-\U0001F6FF"
-    r"\U0001F700-\U0001F77F"
-    r"\U0001F780-\U0001F7FF"
-    r"\U0001F800-\U0001F8FF"
-    r"\U0001F900-\U0001F9FF"
-    r"\U0001FA00-\U0001FA6F"
-    r"\U0001FA70-\U0001FAFF"
-    r"\u2600-\u26FF"
-    r"\u2700-\u27BF"
-    r"]",
-    re.UNICODE,
+# 表情符号的码位区间（闭区间）
+_EMOJI_RANGES = (
+    (0x1F300, 0x1F5FF),
+    (0x1F600, 0x1F64F),
+    (0x1F680, 0x1F6FF),
+    (0x1F700, 0x1F77F),
+    (0x1F780, 0x1F7FF),
+    (0x1F800, 0x1F8FF),
+    (0x1F900, 0x1F9FF),
+    (0x1FA00, 0x1FA6F),
+    (0x1FA70, 0x1FAFF),
+    (0x2600, 0x26FF),
+    (0x2700, 0x27BF),
 )
+# 按起点排序的区间端点数组，二分查找定位码位所在区间（仅几十字节，代替 128K 的查找表）
+_EMOJI_STARTS, _EMOJI_ENDS = (np.array(col, dtype=np.uint32) for col in zip(*sorted(_EMOJI_RANGES)))
 
 
-def _count_emojis(s: str) -> int:
-    if not isinstance(s, str):
+def _count_emojis_total(texts: pd.Series) -> int:
+    """整列文本中的表情总数：拼接后一次转为 UTF-32 码位数组，按区间二分计数（非 str 值如 bytes / 数字 / 空值不计）"""
+    joined = "".join(s for s in texts.tolist() if isinstance(s, str))
+    if not joined:
         return 0
-    return len(_EMOJI_RE.findall(s))
+    codes = np.frombuffer(joined.encode("utf-32-le", errors="surrogatepass"), dtype=np.uint32)
+    idx = np.searchsorted(_EMOJI_STARTS, codes, side="right") - 1
+    return int(((idx >= 0) & (codes <= _EMOJI_ENDS[idx])).sum())
 
 
 def _ensure_datetime_series(series: pd.Series) -> pd.Series:
     """CreateTime 可能是秒/毫秒或已是 datetime，统一转为 pandas datetime"""
     if np.issubdtype(series.dtype, np.datetime64):
-        return pd.to_datetime(series)
+        return series
     numeric = pd.to_numeric(series, errors="coerce")
-    unit = "ms" if (pd.notna(numeric).any() and numeric.max() > 1e12) else "s"
+    # 只看首个有效值判断秒/毫秒，避免整列 any()/max() 两次扫描
+    first = numeric.first_valid_index()
+    unit = "ms" if (first is not None and numeric.loc[first] > 1e12) else "s"
     return pd.to_datetime(numeric, unit=unit, errors="coerce")
 
 
+# 时间列 / 发送方列（多名字兜底）
+_TS_COLUMNS = ["CreateTime", "create_time", "Timestamp", "Datetime", "dt", "time"]
+_IS_SELF_COLUMNS = ["IsSender", "is_sender", "IsSend", "is_send", "is_self"]
+
+
+def _with_parsed_time(messages: pd.DataFrame) -> Optional[pd.DataFrame]:
+    """
+    解析时间列一次：追加 _dt 列、去掉无效时间并按时间排序，供互动分析与成就计算共用；
+    已含 _dt 时原样返回，无时间列时返回 None
+    """
+    if "_dt" in messages.columns:
+        return messages
+    ts_col = next((c for c in _TS_COLUMNS if c in messages.columns), None)
+    if ts_col is None:
+        return None
+    dt = _ensure_datetime_series(messages[ts_col])
+    df = messages.assign(_dt=dt).dropna(subset=["_dt"])
+    # 数据库读出的消息通常已按时间有序，此时跳过排序
+    if df["_dt"].is_monotonic_increasing:
+        return df
+    # 稳定排序：同一时刻的消息保持入库顺序，且对已近乎有序的输入更快
+    return df.sort_values("_dt", kind="mergesort")
+
+
+def _time_parts(dt: pd.Series) -> Dict[str, pd.Series]:
+    """
+    一次性分解时间分量：_weekday / _hour 为 int8，_month 为整数月序号（年 * 12 + 月 - 1）；
+    年份可由 _month 整除得到，月份字符串只在汇总时按需生成
+    """
+    acc = dt.dt
+    return {
+        "_weekday": acc.weekday.astype(np.int8),
+        "_hour": acc.hour.astype(np.int8),
+        "_month": (acc.year * 12 + acc.month - 1).astype(np.int32),
+    }
+
+
 def _compute_interaction_analysis(messages: pd.DataFrame) -> Dict:
     """
     互动模式分析：
@@ -116,60 +215,67 @@ def _compute_interaction_analysis(messages: pd.DataFrame) -> Dict:
     if messages is None or len(messages) == 0:
         return {}
 
-    df = messages.copy()
-
-    # 时间列 / 发送方列（多名字兜底）
-    ts_col = next((c for c in ["CreateTime", "create_time", "Timestamp", "Datetime", "dt", "time"] if c in df.columns), None)
-    if ts_col is None:
+    df = _with_parsed_time(messages)
+    if df is None:
         return {}
 
-    is_self_col = next((c for c in ["IsSender", "is_sender", "IsSend", "is_send", "is_self"] if c in df.columns), None)
+    is_self_col = next((c for c in _IS_SELF_COLUMNS if c in df.columns), None)
     is_self = df[is_self_col].astype(int) if is_self_col in df.columns else pd.Series(np.zeros(len(df), dtype=int), index=df.index)
-
-    dt = _ensure_datetime_series(df[ts_col])
-    df = df.assign(_dt=dt, _is_self=is_self).dropna(subset=["_dt"]).sort_values("_dt").reset_index(drop=True)
+    df = df.assign(_is_self=is_self).reset_index(drop=True)
 
     # 以 45 分钟切分会话
     SESSION_GAP = pd.Timedelta(minutes=45)
-    gap = df["_dt"].diff()
-    session_id = (gap.isna() | (gap > SESSION_GAP)).cumsum()
-    df["_session"] = session_id
+
+    # 数据已按时间排序，同一会话的行连续：相邻间隔超过阈值处即会话起点，
+    # 首条 / 条数 / 发送方最小最大值都按起点下标切分计算，无需 groupby
+    n = len(df)
+    dt_ns = df["_dt"].to_numpy().astype("datetime64[ns]").view(np.int64)
+    starts = np.flatnonzero(np.r_[True, np.diff(dt_ns) > SESSION_GAP.value]) if n > 0 else np.empty(0, dtype=np.int64)
+    is_self_vals = df["_is_self"].to_numpy()
 
     # 发起者：各会话首条消息
-    firsts = df.groupby("_session").first(numeric_only=False)
-    self_sessions = int((firsts["_is_self"] == 1).sum())
-    friend_sessions = int((firsts["_is_self"] == 0).sum())
+    firsts_is_self = is_self_vals[starts]
+    self_sessions = int((firsts_is_self == 1).sum())
+    friend_sessions = int((firsts_is_self == 0).sum())
     total_sessions = self_sessions + friend_sessions
     self_rate = (self_sessions / total_sessions) if total_sessions > 0 else 0.0
 
     # 回复延迟（仅统计身份翻转处）
     flip = df["_is_self"].ne(df["_is_self"].shift(1))
     delays = (df.loc[flip, "_dt"] - df.loc[flip, "_dt"].shift(1)).dropna().dt.total_seconds()
-    bins = [0, 60, 300, 600, 1800, 3600, 10800, float("inf")]
+    edges = [60, 300, 600, 1800, 3600, 10800]
     labels = ["<1m", "1-5m", "5-10m", "10-30m", "30-60m", "1-3h", ">3h"]
     if len(delays) > 0:
-        cats = pd.cut(delays, bins=bins, labels=labels, right=False)
-        delay_counts = cats.value_counts().reindex(labels, fill_value=0)
-        median_delay = float(np.median(delays))
-        p90_delay = float(np.percentile(delays, 90))
+        # side="right" 对应左闭右开区间 [a, b)
+        delay_counts = np.bincount(np.searchsorted(edges, delays, side="right"), minlength=len(labels))
+        # 一次 partition 同时定位中位数与 P90 所需的顺序统计量（线性插值同 np.percentile）
+        vals = delays.to_numpy(dtype=np.float64)
+        m = len(vals)
+        pos90 = 0.9 * (m - 1)
+        k90 = int(pos90)
+        kth = sorted({(m - 1) // 2, m // 2, k90, min(k90 + 1, m - 1)})
+        part = np.partition(vals, kth)
+        median_delay = float((part[(m - 1) // 2] + part[m // 2]) / 2)
+        lo, hi, t = part[k90], part[min(k90 + 1, m - 1)], pos90 - k90
+        p90_delay = float(hi - (hi - lo) * (1 - t) if t >= 0.5 else lo + (hi - lo) * t)
     else:
-        delay_counts = pd.Series(0, index=labels)
+        delay_counts = np.zeros(len(labels), dtype=np.int64)
         median_delay = 0.0
         p90_delay = 0.0
 
     # 会话长度分布
-    session_sizes = df.groupby("_session").size()
-    len_bins = [1, 2, 4, 7, 11, float("inf")]
+    session_sizes = pd.Series(np.diff(np.r_[starts, n]))
+    len_edges = [2, 4, 7, 11]
     len_labels = ["1", "2-3", "4-6", "7-10", ">10"]
-    if len(session_sizes) > 0:
-        len_cats = pd.cut(session_sizes, bins=len_bins, labels=len_labels, right=False, include_lowest=True)
-        len_counts = len_cats.value_counts().reindex(len_labels, fill_value=0)
-    else:
-        len_counts = pd.Series(0, index=len_labels)
+    len_counts = np.bincount(np.searchsorted(len_edges, session_sizes, side="right"), minlength=len(len_labels))
 
     # 单向/双向
-    session_self_speak = df.groupby("_session")["_is_self"].agg(["min", "max"])
-    one_way = int((session_self_speak["min"] == session_self_speak["max"]).sum())
+    if n > 0:
+        mins = np.minimum.reduceat(is_self_vals, starts)
+        maxs = np.maximum.reduceat(is_self_vals, starts)
+        one_way = int((mins == maxs).sum())
+    else:
+        one_way = 0
     two_way = int(total_sessions - one_way)
     one_way_rate = (one_way / total_sessions) if total_sessions > 0 else 0.0
 
@@ -181,13 +287,13 @@ def _compute_interaction_analysis(messages: pd.DataFrame) -> Dict:
             "self_rate": round(self_rate, 4),
         },
         "reply_delay": {
-            "bins": [{"range": lab, "count": int(delay_counts[lab])} for lab in labels],
+            "bins": [{"range": lab, "count": int(c)} for lab, c in zip(labels, delay_counts)],
             "median_seconds": round(median_delay, 2),
             "p90_seconds": round(p90_delay, 2),
             "pairs": int(len(delays)),
         },
         "conversation_length": {
-            "bins": [{"range": lab, "count": int(len_counts[lab])} for lab in len_labels],
+            "bins": [{"range": lab, "count": int(c)} for lab, c in zip(len_labels, len_counts)],
             "mean": float(session_sizes.mean()) if len(session_sizes) > 0 else 0.0,
             "median": float(session_sizes.median()) if len(session_sizes) > 0 else 0.0,
             "sessions": int(total_sessions),
@@ -215,47 +321,41 @@ def _compute_achievements(messages: pd.DataFrame, inter: Dict) -> List[Dict]:
     if messages is None or len(messages) == 0:
         return []
 
-    df = messages.copy()
-
-    ts_col = next((c for c in ["CreateTime", "create_time", "Timestamp", "Datetime", "dt", "time"] if c in df.columns), None)
-    if ts_col is None:
+    df = _with_parsed_time(messages)
+    if df is None:
         return []
 
-    dt = _ensure_datetime_series(df[ts_col])
-    df = df.assign(_dt=dt).dropna(subset=["_dt"]).sort_values("_dt")
-
     text_col = next((c for c in ["Content", "StrContent", "content", "text"] if c in df.columns), None)
     type_col = next((c for c in ["Type", "type"] if c in df.columns), None)
     subtype_col = next((c for c in ["SubType", "sub_type", "SubTypeInt"] if c in df.columns), None)
-    is_self_col = next((c for c in ["IsSender", "is_sender", "IsSend", "is_send", "is_self"] if c in df.columns), None)
-    is_self = df[is_self_col].astype(int) if is_self_col in df.columns else pd.Series(np.zeros(len(df), dtype=int), index=df.index)
-    df["_is_self"] = is_self
+    is_self_col = next((c for c in _IS_SELF_COLUMNS if c in df.columns), None)
 
-    # 指标
-    deep_night_count = int(((df["_dt"].dt.hour >= 0) & (df["_dt"].dt.hour <= 5)).sum())
+    # 指标（只读取所需列，不再为发送方标记整表 assign 复制一份）
+    hour = df["_dt"].dt.hour.to_numpy()
+    deep_night_count = int(np.count_nonzero(hour <= 5))
 
     total_msgs = len(df)
     if text_col:
-        emoji_counts = df[text_col].apply(_count_emojis)
-        emoji_rate = float(emoji_counts.sum() / total_msgs) if total_msgs > 0 else 0.0
-        avg_len = float(df[text_col].astype(str).str.len().mean())
+        emoji_rate = float(_count_emojis_total(df[text_col]) / total_msgs) if total_msgs > 0 else 0.0
+        # object / string 列直接取 .str.len()，不再整列 astype(str) 复制一遍
+        texts = df[text_col]
+        if texts.dtype != object and not isinstance(texts.dtype, pd.StringDtype):
+            texts = texts.astype("string")
+        mean_len = texts.str.len().mean()
+        avg_len = float(mean_len) if pd.notna(mean_len) else 0.0
     else:
         emoji_rate = 0.0
         avg_len = 0.0
 
     # 最长连续聊天天数
-    days = df["_dt"].dt.normalize().drop_duplicates().sort_values()
-    if len(days) == 0:
-        max_streak = 0
+    # 去重后的日期序列按"相邻相差 1 天"切成连续段，取最长段长度
+    days = np.unique(df["_dt"].to_numpy().astype("datetime64[D]"))
+    if len(days) <= 1:
+        max_streak = len(days)
     else:
-        streak = 1
-        max_streak = 1
-        for i in range(1, len(days)):
-            if (days.iloc[i] - days.iloc[i - 1]).days == 1:
-                streak += 1
-                max_streak = max(max_streak, streak)
-            else:
-                streak = 1
+        breaks = np.diff(days).astype(np.int64) != 1
+        bounds = np.flatnonzero(np.concatenate(([True], breaks, [True])))
+        max_streak = int(np.diff(bounds).max())
 
     # 从互动分析中拿派生指标
     sessions = inter.get("conversation_length", {}).get("sessions", 0) if inter else 0
@@ -264,17 +364,22 @@ def _compute_achievements(messages: pd.DataFrame, inter: Dict) -> List[Dict]:
 
     # 非文本占比（按你的约定：Type=1 文本；Type=49 & SubType=57 视作“带引用文本”）
     if type_col:
+        # 先统一转成 int32 数组再比较，避免 pandas 逐步生成中间布尔 Series
+        t = pd.to_numeric(df[type_col], errors="coerce").fillna(0).to_numpy(np.int32)
+        is_text = t == 1
         if subtype_col:
-            is_text = (df[type_col] == 1) | ((df[type_col] == 49) & (df[subtype_col] == 57))
-        else:
-            is_text = (df[type_col] == 1)
-        non_text_ratio = float((~is_text).sum() / len(df)) if len(df) > 0 else 0.0
-        non_text_count = int((~is_text).sum())
+            st = pd.to_numeric(df[subtype_col], errors="coerce").fillna(0).to_numpy(np.int32)
+            is_text |= (t == 49) & (st == 57)
+        non_text_count = int(len(is_text) - np.count_nonzero(is_text))
+        non_text_ratio = float(non_text_count / len(df)) if len(df) > 0 else 0.0
     else:
         non_text_ratio = 0.0
         non_text_count = 0
 
-    send_ratio = float((df["_is_self"] == 1).sum() / total_msgs) if total_msgs > 0 else 0.0
+    if is_self_col and total_msgs > 0:
+        send_ratio = float(np.count_nonzero(df[is_self_col].astype(int).to_numpy() == 1) / total_msgs)
+    else:
+        send_ratio = 0.0
 
     def mk(name, key, cond, progress, desc):
         return {
@@ -300,98 +405,125 @@ def _compute_achievements(messages: pd.DataFrame, inter: Dict) -> List[Dict]:
 # =========================
 # 其余分析（来自你原始实现）
 # =========================
-def categorize_relationships(scores):
-    """将好友关系分类"""
-    categories = {"密友圈": [], "社交圈": [], "工作圈": [], "泛社交": []}
-    for friend in scores:
-        if friend["score"] >= 8:
-            categories["密友圈"].append(friend)
-        elif friend["score"] >= 6:
-            categories["社交圈"].append(friend)
-        elif friend["score"] >= 4:
-            categories["工作圈"].append(friend)
-        else:
-            categories["泛社交"].append(friend)
+# 关系圈（按分数从高到低）与分界线：>=8 密友圈，6-8 社交圈，4-6 工作圈，<4 泛社交
+_CIRCLES = ("密友圈", "社交圈", "工作圈", "泛社交")
+_CIRCLE_BINS = (4, 6, 8)
+# 网络图的分类样式，顺序与 _CIRCLES 一致（只读，批量结果间共享）
+_GRAPH_CATEGORIES = [
+    {"name": "密友圈", "itemStyle": {"color": "#52c41a"}},
+    {"name": "社交圈", "itemStyle": {"color": "#1890ff"}},
+    {"name": "工作圈", "itemStyle": {"color": "#faad14"}},
+    {"name": "泛社交", "itemStyle": {"color": "#d9d9d9"}},
+]
+_WEEKDAY_NAMES = ("周一", "周二", "周三", "周四", "周五", "周六", "周日")
+
+
+def _circle_rank(arr: np.ndarray) -> np.ndarray:
+    """分数 -> 关系圈下标（_CIRCLES 中的位置，0 为密友圈）"""
+    return len(_CIRCLE_BINS) - np.digitize(arr, _CIRCLE_BINS)
+
+
+def categorize_relationships(scores, arr: np.ndarray):
+    """将好友关系分类，arr 为与 scores 一一对应的分数数组（复用批量统计时构建的数组）"""
+    rank = _circle_rank(arr)
+    categories = {
+        label: [scores[i] for i in np.flatnonzero(rank == k).tolist()] for k, label in enumerate(_CIRCLES)
+    }
+    counts = np.bincount(rank, minlength=len(_CIRCLES)).tolist()
     return {
         "categories": categories,
-        "summary": {
-            "密友圈": len(categories["密友圈"]),
-            "社交圈": len(categories["社交圈"]),
-            "工作圈": len(categories["工作圈"]),
-            "泛社交": len(categories["泛社交"]),
-        },
+        "summary": dict(zip(_CIRCLES, counts)),
     }
 
 
-def analyze_user_preference(all_dimensions, analyzed_count):
-    """分析用户偏好（内部函数）"""
+# 维度矩阵的列顺序（与 analyzer 返回的维度分数行一致）
+_DIM_KEYS = RelationAnalyzer.DIMENSION_KEYS
+_DIM_NAMES = {"interaction": "互动频率", "content": "内容质量", "emotion": "情感表达", "depth": "深度交流"}
+_USER_TYPES = {"interaction": "互动型", "content": "深度型", "emotion": "情感型", "depth": "分享型"}
+
+
+def analyze_user_preference(dims: np.ndarray, analyzed_count):
+    """分析用户偏好（内部函数），dims 为 (N, 4) 维度矩阵，列顺序同 _DIM_KEYS"""
     if analyzed_count == 0:
         return {"user_type": "未知", "preferences": {}, "description": "数据不足，无法分析", "analyzed_count": 0}
 
-    preference = {}
-    for dim, scores in all_dimensions.items():
-        if scores:
-            avg = np.mean(scores)
-            std = np.std(scores)
-            preference[dim] = {"average": round(avg, 2), "std": round(std, 2), "strength": round(avg / 10, 2)}
-        else:
-            preference[dim] = {"average": 0, "std": 0, "strength": 0}
-
-    if preference:
-        max_dim = max(preference.items(), key=lambda x: x[1]["average"])
-        dim_names = {"interaction": "互动频率", "content": "内容质量", "emotion": "情感表达", "depth": "深度交流"}
-        user_types = {"interaction": "互动型", "content": "深度型", "emotion": "情感型", "depth": "分享型"}
-        return {
-            "user_type": user_types[max_dim[0]],
-            "preferences": preference,
-            "description": f"基于{analyzed_count}位好友的分析，你是一个{user_types[max_dim[0]]}社交者，最注重{dim_names[max_dim[0]]}",
-            "analyzed_count": analyzed_count,
-        }
+    # 按维度一次性归约（dims 为空时各维度记 0）；转置为连续行后沿行归约，
+    # 与逐维度 1-D np.mean / np.std 同样走成对求和，结果逐位一致（跨步的 axis=0 归约会有末位误差）
+    if dims.shape[0] > 0:
+        cols = np.ascontiguousarray(dims.T)
+        avgs, stds = cols.mean(axis=1), cols.std(axis=1)
     else:
-        return {"user_type": "未知", "preferences": preference, "description": "数据不足", "analyzed_count": analyzed_count}
-
-
-def analyze_time_patterns(all_time_data):
-    """分析时间模式 - 用于热力图和月度分析"""
-    heatmap_data = defaultdict(lambda: defaultdict(int))
-    monthly_data = defaultdict(int)
-    yearly_data = defaultdict(int)
-    hourly_distribution = defaultdict(int)
-    weekday_distribution = defaultdict(int)
-
-    for time_entry in all_time_data:
-        weekday = time_entry["weekday"]
-        hour = time_entry["hour"]
-        month_key = time_entry["month"]
-        year = time_entry["year"]
-        count = time_entry["count"]
-        heatmap_data[weekday][hour] += count
-        monthly_data[month_key] += count
-        yearly_data[year] += count
-        hourly_distribution[hour] += count
-        weekday_distribution[weekday] += count
-
-    heatmap_formatted = []
-    weekday_names = ["周一", "周二", "周三", "周四", "周五", "周六", "周日"]
-    for weekday in range(7):
-        for hour in range(24):
-            heatmap_formatted.append(
-                {"weekday": weekday, "weekday_name": weekday_names[weekday], "hour": hour, "value": heatmap_data[weekday][hour]}
-            )
+        avgs = stds = np.zeros(len(_DIM_KEYS))
+    averages = [round(avg, 2) for avg in avgs.tolist()]
+    preference = {
+        dim: {"average": avg, "std": round(std, 2), "strength": round(raw / 10, 2)}
+        for dim, avg, raw, std in zip(_DIM_KEYS, averages, avgs.tolist(), stds.tolist())
+    }
+
+    # 按保留两位后的平均分取最高维度，np.argmax 同分取 _DIM_KEYS 中靠前者
+    max_dim = _DIM_KEYS[int(np.argmax(averages))]
+    return {
+        "user_type": _USER_TYPES[max_dim],
+        "preferences": preference,
+        "description": f"基于{analyzed_count}位好友的分析，你是一个{_USER_TYPES[max_dim]}社交者，最注重{_DIM_NAMES[max_dim]}",
+        "analyzed_count": analyzed_count,
+    }
+
 
-    sorted_months = sorted(monthly_data.keys())
-    last_12_months = sorted_months[-12:] if len(sorted_months) > 12 else sorted_months
-    monthly_trend = [{"month": month, "count": monthly_data[month]} for month in last_12_months]
+# 时间聚合列 (weekday, hour, month_idx, count) 的紧凑类型：星期/小时 1 字节，月序号与计数 4 字节
+_TIME_COLUMN_DTYPES = (np.int8, np.int8, np.int32, np.int32)
+
+# 热力图格子坐标 (weekday, hour)，按 (7, 24) 数组的行优先顺序排列
+_HEATMAP_CELLS = list(zip(*(axis.ravel().tolist() for axis in np.indices((7, 24)))))
+
+
+@njit(cache=True)
+def _time_agg_kernel(weekday, hour, month_idx, count, month0, year0, heatmap, monthly, yearly):
+    """按 (weekday, hour, 月序号) 记录累加热力图/月度/年度计数；月序号 = 年 * 12 + 月 - 1"""
+    for i in range(weekday.shape[0]):
+        c = count[i]
+        heatmap[weekday[i], hour[i]] += c
+        monthly[month_idx[i] - month0] += c
+        yearly[month_idx[i] // 12 - year0] += c
+
+
+def analyze_time_patterns(weekday, hour, month_idx, count):
+    """分析时间模式 - 用于热力图和月度分析；输入为等长的列数组（各联系人聚合记录拼接而成，类型见 _TIME_COLUMN_DTYPES）"""
+    month0 = int(month_idx.min())
+    year0 = month0 // 12
+    heatmap = np.zeros((7, 24), dtype=np.int64)
+    monthly = np.zeros(int(month_idx.max()) - month0 + 1, dtype=np.int64)
+    yearly = np.zeros(int(month_idx.max()) // 12 - year0 + 1, dtype=np.int64)
+    _time_agg_kernel(weekday, hour, month_idx, count, month0, year0, heatmap, monthly, yearly)
+
+    yearly_data = {year0 + k: int(yearly[k]) for k in np.flatnonzero(yearly).tolist()}
+    hourly = heatmap.sum(axis=0)
+    weekday_dist = heatmap.sum(axis=1)
+    total = int(hourly.sum())
+
+    # 按行优先顺序与 (weekday, hour) 坐标一一对应，一次推导生成 168 个格子
+    heatmap_formatted = [
+        {"weekday": w, "weekday_name": _WEEKDAY_NAMES[w], "hour": h, "value": v}
+        for (w, h), v in zip(_HEATMAP_CELLS, heatmap.ravel().tolist())
+    ]
+
+    # monthly 按月序号升序排列，有消息的最近 12 个月即非零下标的末尾 12 个，无需排序；只为这些月份生成字符串
+    last_12_months = np.flatnonzero(monthly)[-12:].tolist()
+    monthly_trend = [
+        {"month": f"{(month0 + k) // 12:04d}-{(month0 + k) % 12 + 1:02d}", "count": int(monthly[k])} for k in last_12_months
+    ]
 
-    monthly_growth = []
-    for i in range(1, len(monthly_trend)):
-        prev = monthly_trend[i - 1]["count"]
-        curr = monthly_trend[i]["count"]
-        growth = ((curr - prev) / prev * 100) if prev > 0 else 0
-        monthly_growth.append({"month": monthly_trend[i]["month"], "growth": round(growth, 2)})
+    # 环比增长：上月为 0 时记 0（分母先替换为 1 避免除零告警）
+    counts = monthly[last_12_months]
+    prev, curr = counts[:-1], counts[1:]
+    growth = np.where(prev > 0, (curr - prev) / np.where(prev > 0, prev, 1) * 100, 0.0)
+    monthly_growth = [
+        {"month": trend["month"], "growth": round(g, 2)} for trend, g in zip(monthly_trend[1:], growth.tolist())
+    ]
 
-    peak_hour = max(hourly_distribution.items(), key=lambda x: x[1])[0] if hourly_distribution else 12
-    peak_weekday = max(weekday_distribution.items(), key=lambda x: x[1])[0] if weekday_distribution else 0
+    # argmax 同值取最小下标
+    peak_hour = int(hourly.argmax()) if total else 12
+    peak_weekday = int(weekday_dist.argmax()) if total else 0
 
     return {
         "heatmap": heatmap_formatted,
@@ -399,18 +531,14 @@ def analyze_time_patterns(all_time_data):
         "monthly_growth": monthly_growth,
         "yearly_summary": dict(yearly_data),
         "peak_hour": peak_hour,
-        "peak_weekday": weekday_names[peak_weekday],
-        "total_active_hours": len([h for h, count in hourly_distribution.items() if count > 0]),
-        "night_owl_score": round(
-            (sum(hourly_distribution.get(h, 0) for h in range(0, 6)) / sum(hourly_distribution.values()) * 100), 2
-        )
-        if hourly_distribution
-        else 0,
+        "peak_weekday": _WEEKDAY_NAMES[peak_weekday],
+        "total_active_hours": int(np.count_nonzero(hourly)),
+        "night_owl_score": round(int(hourly[:6].sum()) / total * 100, 2) if total else 0,
     }
 
 
-def calculate_social_health(scores, all_dimensions, total_contacts):
-    """计算社交健康度"""
+def calculate_social_health(scores, arr: np.ndarray, dims: np.ndarray, total_contacts):
+    """计算社交健康度，arr 为与 scores 一一对应的分数数组"""
     if not scores:
         return {
             "overall_health": 0,
@@ -422,27 +550,29 @@ def calculate_social_health(scores, all_dimensions, total_contacts):
             "suggestions": [],
         }
 
+    # 关系状态只取一遍，各指数均由数组掩码计数得到
+    n = len(scores)
+    status = np.array([s["relationship_status"] for s in scores])
+
     # 1. 多样性指数
-    score_values = [s["score"] for s in scores]
-    if len(score_values) > 1:
-        std_dev = np.std(score_values)
+    if n > 1:
+        std_dev = float(arr.std())
         diversity_index = max(0, min(100, 100 - abs(std_dev - 2.5) * 20))
     else:
         diversity_index = 50
 
     # 2. 平衡度
-    high_score_friends = len([s for s in scores if s["score"] >= 6])
-    high_score_ratio = high_score_friends / len(scores) if scores else 0
+    high_score_ratio = int(np.count_nonzero(arr >= 6)) / n
     balance_index = max(0, min(100, 100 - abs(high_score_ratio - 0.25) * 200))
 
     # 3. 维护指数
-    active_count = len([s for s in scores if s.get("relationship_status") == "活跃"])
-    dormant_count = len([s for s in scores if s.get("relationship_status") in ["休眠", "失联"]])
-    maintenance_index = (active_count / len(scores) * 100) if scores else 0
+    active_count = int(np.count_nonzero(status == "活跃"))
+    dormant_count = int(np.count_nonzero(np.isin(status, ("休眠", "失联"))))
+    maintenance_index = active_count / n * 100
 
     # 4. 情感表达
-    if all_dimensions and "emotion" in all_dimensions and all_dimensions["emotion"]:
-        emotion_avg = np.mean(all_dimensions["emotion"])
+    if dims is not None and dims.shape[0] > 0:
+        emotion_avg = float(np.ascontiguousarray(dims[:, _DIM_KEYS.index("emotion")]).mean())
         emotional_index = min(100, emotion_avg * 10)
     else:
         emotional_index = 50
@@ -479,48 +609,40 @@ def calculate_social_health(scores, all_dimensions, total_contacts):
     }
 
 
-def prepare_network_graph_data(scores):
-    """准备关系网络图数据"""
+def prepare_network_graph_data(scores, arr: np.ndarray):
+    """准备关系网络图数据，arr 为与 scores 一一对应的分数数组"""
     if not scores:
         return None
 
     graph_scores = scores[:50] if len(scores) > 50 else scores
-    nodes = []
-    edges = []
-    categories = [
-        {"name": "密友圈", "itemStyle": {"color": "#52c41a"}},
-        {"name": "社交圈", "itemStyle": {"color": "#1890ff"}},
-        {"name": "工作圈", "itemStyle": {"color": "#faad14"}},
-        {"name": "泛社交", "itemStyle": {"color": "#d9d9d9"}},
-    ]
+    n = len(graph_scores)
+    # 所有节点的尺寸/位置/样式一次性按数组计算，循环中只做标量取值
+    s = arr[:n]
+    mc = np.fromiter((f["message_count"] for f in graph_scores), dtype=np.float64, count=n)
+    category = _circle_rank(s).tolist()
+    size = np.clip(np.log(mc + 1) * 3, 10, 30).tolist()
+    distance = (10 - s) * 30
+    angle = np.random.default_rng().random(n) * 2 * np.pi
+    xs = (distance * np.cos(angle)).tolist()
+    ys = (distance * np.sin(angle)).tolist()
+    width = np.minimum(5, s / 2).tolist()
+    opacity = np.minimum(1, s / 10).tolist()
 
     # 中心节点
-    nodes.append({"id": "center", "name": "我", "symbolSize": 50, "category": -1, "itemStyle": {"color": "#ff6464"}, "x": 0, "y": 0, "fixed": True})
+    nodes = [{"id": "center", "name": "我", "symbolSize": 50, "category": -1, "itemStyle": {"color": "#ff6464"}, "x": 0, "y": 0, "fixed": True}]
+    edges = []
 
     # 好友节点 + 边
-    for friend in graph_scores:
-        if friend["score"] >= 8:
-            category = 0
-        elif friend["score"] >= 6:
-            category = 1
-        elif friend["score"] >= 4:
-            category = 2
-        else:
-            category = 3
-
-        size = min(30, max(10, np.log(friend["message_count"] + 1) * 3))
-        distance = (10 - friend["score"]) * 30
-        angle = np.random.random() * 2 * np.pi
-
+    for i, friend in enumerate(graph_scores):
         nodes.append(
             {
                 "id": friend["user_name"],
                 "name": friend["display_name"][:10],
                 "value": friend["score"],
-                "symbolSize": size,
-                "category": category,
-                "x": distance * np.cos(angle),
-                "y": distance * np.sin(angle),
+                "symbolSize": size[i],
+                "category": category[i],
+                "x": xs[i],
+                "y": ys[i],
             }
         )
 
@@ -529,11 +651,432 @@ def prepare_network_graph_data(scores):
                 "source": "center",
                 "target": friend["user_name"],
                 "value": friend["score"],
-                "lineStyle": {"width": min(5, friend["score"] / 2), "opacity": min(1, friend["score"] / 10)},
+                "lineStyle": {"width": width[i], "opacity": opacity[i]},
             }
         )
 
-    return {"nodes": nodes, "edges": edges, "categories": categories}
+    return {"nodes": nodes, "edges": edges, "categories": _GRAPH_CATEGORIES}
+
+
+# =========================
+# 评分/报告结果缓存
+# =========================
+class _LRUCache:
+    """线程安全的定长 LRU 缓存（线程池与请求线程共用）"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[tuple, object]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return key in self._data
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+# (联系人, 聊天记录指纹) -> 评分结果与维度分数行
+_rscore_cache = _LRUCache(4096)
+# (联系人, 聊天记录指纹) -> 完整报告；报告缓存命中时连消息都不必读取，条目较大故容量较小
+_report_cache = _LRUCache(256)
+
+
+def _rscore_cached(user_name: str, fingerprint: str, messages: pd.DataFrame) -> Tuple[Dict, np.ndarray]:
+    """
+    按 (联系人, 聊天记录指纹) 缓存 analyzer.calculate_rscore_with_row 的结果（LRU）。
+    聊天记录未变化时直接复用；返回结果的浅拷贝（调用方可自由追加字段）与维度分数行。
+    """
+    key = (user_name, fingerprint)
+    cached = _rscore_cache.get(key)
+    if cached is not None:
+        return dict(cached[0]), cached[1]
+
+    result, dim_row = _score_messages(messages)
+    _rscore_cache.put(key, (result, dim_row))
+    return dict(result), dim_row
+
+
+def _scoring_frame(messages: pd.DataFrame) -> pd.DataFrame:
+    """只保留评分读取的列，CompressContent 仅留引用消息的，减少送往子进程的序列化数据"""
+    df = messages[[c for c in RelationAnalyzer.INPUT_COLUMNS if c in messages.columns]]
+    if "CompressContent" in df.columns and "Type" in df.columns and "SubType" in df.columns:
+        is_quote = (df["Type"] == 49) & (df["SubType"] == 57)
+        df = df.assign(CompressContent=df["CompressContent"].where(is_quote))
+    return df
+
+
+def _score_messages(messages: pd.DataFrame) -> Tuple[Dict, np.ndarray]:
+    """
+    在子进程中计算评分（analyzer 无可变状态，可直接序列化）；
+    进程池损坏（子进程崩溃）时重建进程池，本次改为进程内计算
+    """
+    global process_pool
+    pool = process_pool
+    if pool is not None:
+        try:
+            return pool.submit(analyzer.calculate_rscore_with_row, _scoring_frame(messages)).result()
+        except BrokenProcessPool:
+            logger.warning("评分进程池已损坏，重建进程池，本次改为进程内计算")
+            with _process_pool_lock:
+                # 多个线程可能同时发现损坏，只由第一个重建
+                if process_pool is pool:
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    process_pool = _new_process_pool()
+    return analyzer.calculate_rscore_with_row(messages)
+
+
+def _build_report(user_name: str) -> Optional[Dict]:
+    """
+    单个联系人的完整报告：评分 + 互动分析 + 成就；无聊天记录时返回 None。
+    calculate_rscore 与 export_report 共用按聊天记录指纹缓存的报告，记录未变化时跳过消息读取与全部计算
+    """
+    # 先做廉价的存在性检查，未知联系人无需加载整张消息表
+    if not db.has_messages(user_name):
+        return None
+
+    fingerprint = db.get_chat_fingerprint(user_name)
+    key = (user_name, fingerprint)
+    cached = _report_cache.get(key)
+    if cached is not None:
+        return dict(cached)
+
+    messages = db.get_chat_messages(user_name)
+
+    result, _ = _rscore_cached(user_name, fingerprint, messages)
+    # 时间只解析、排序一次，互动分析与成就计算共用
+    prepared = _with_parsed_time(messages) if not messages.empty else None
+    inter = _compute_interaction_analysis(prepared)
+    result["interaction_analysis"] = inter
+    result["achievements"] = _compute_achievements(prepared, inter)
+    _report_cache.put(key, result)
+    return dict(result)
+
+
+# 联系人列表缓存：(写入时间, 列表)；联系人表很少变化，contacts 与批量分析共用
+_contacts_cache: Optional[tuple] = None
+_contacts_cache_lock = asyncio.Lock()
+
+
+async def _cached_contacts() -> List[Dict]:
+    """带 TTL 的 db.get_contacts()，在线程中读取以免阻塞事件循环；返回的列表为共享对象，调用方不应修改"""
+    global _contacts_cache
+    async with _contacts_cache_lock:
+        if _contacts_cache is not None and time.monotonic() - _contacts_cache[0] < Config.CONTACTS_CACHE_TTL:
+            return _contacts_cache[1]
+
+        contacts = await asyncio.to_thread(db.get_contacts)
+        _contacts_cache = (time.monotonic(), contacts)
+        return contacts
+
+
+def _fetch_bulk(
+    user_names: List[str],
+) -> Tuple[Dict[str, pd.DataFrame], Dict[str, np.ndarray], Dict[str, str]]:
+    """
+    批量读取聊天记录（每个MSG库一次查询，替代逐联系人查询）：先取指纹，评分缓存未命中的联系人读取完整消息，
+    命中的只读取时间戳（仅用于时间模式统计），返回 (完整消息, 时间戳, 指纹)
+    """
+    fingerprints = db.get_chat_fingerprints_bulk(user_names)
+    misses, hits = [], []
+    for user_name in user_names:
+        fingerprint = fingerprints[user_name]
+        # 各库 COUNT 均为 0（"MSGx.db=0:0"）即无聊天记录，两类数据都无需读取
+        if all(part.endswith(":0") for part in fingerprint.split("|")):
+            continue
+        (hits if (user_name, fingerprint) in _rscore_cache else misses).append(user_name)
+    messages = db.get_chat_messages_bulk(misses) if misses else {}
+    times = db.get_chat_times_bulk(hits) if hits else {}
+    return messages, times, fingerprints
+
+
+def _analyze_one(
+    contact: Dict,
+    messages: Optional[pd.DataFrame],
+    times: Optional[np.ndarray],
+    fingerprint: str,
+    index: int,
+    total: int,
+) -> Optional[Dict]:
+    """
+    批量分析中单个联系人的处理（在线程池中执行），无聊天记录时返回 None。
+    messages 与 times 二选一：评分缓存命中时只有时间戳 times，否则为完整消息 messages
+    """
+    # 每 256 个联系人采样一次进度（位掩码判断），且仅在 DEBUG 级别下格式化输出
+    if ((index & 255) == 0 or index == total) and logger.isEnabledFor(logging.DEBUG):
+        logger.debug("分析进度: %d/%d (%.1f%%)", index, total, index * 100 / total)
+
+    if messages is None:
+        if times is None or times.size == 0:
+            return None
+        cached = _rscore_cache.get((contact["UserName"], fingerprint))
+        if cached is None:
+            # 读取时间戳后评分缓存条目被淘汰，回退为完整读取
+            messages = db.get_chat_messages(contact["UserName"])
+    if messages is not None:
+        if messages.empty:
+            return None
+        result, dim_row = _rscore_cached(contact["UserName"], fingerprint, messages)
+        create_time = messages["CreateTime"]
+    else:
+        result, dim_row = dict(cached[0]), cached[1]
+        create_time = pd.Series(times)
+    # analyzer 的结果为固定结构（见 RelationAnalyzer.EMPTY_STATISTICS），直接按键访问
+    stats = result["statistics"]
+    score = {
+        "user_name": contact["UserName"],
+        "display_name": contact["DisplayName"],
+        "score": result["total_score"],
+        "message_count": stats["total_messages"],
+        "days": stats["total_days"],
+        "last_chat": stats["last_chat_date"],
+        "relationship_status": result["relationship_status"],
+        "freshness": result["freshness"],
+        "dimensions": result["dimensions"],
+    }
+
+    # 时间数据（热力图/趋势）：整列提取时间分量后按 (weekday, hour, month, year) 聚合计数，
+    # 每个组合只生成一条记录（count 为条数），不再逐条消息构造 dict
+    time_data = None
+    try:
+        # CreateTime 为数据库中的秒级时间戳（analyzer 不修改传入的 DataFrame）
+        ct = _ensure_datetime_series(create_time).dropna()
+        grouped = pd.DataFrame(_time_parts(ct)).groupby(["_weekday", "_hour", "_month"], sort=False).size()
+        time_data = tuple(
+            grouped.index.get_level_values(i).to_numpy(dtype=dtype) for i, dtype in enumerate(_TIME_COLUMN_DTYPES[:3])
+        ) + (grouped.to_numpy(dtype=_TIME_COLUMN_DTYPES[3]),)
+    except Exception as e:
+        logger.warning("处理时间数据时出错: %s", e)
+
+    return {"score": score, "dim_row": dim_row, "time_data": time_data}
+
+
+async def _iter_batch(limit: int):
+    """
+    批量分析的异步生成器：每个联系人评分完成即产出 ("friend", score)（完成顺序），
+    全部结束后产出 ("summary", result)，result 与 _run_batch 的返回值一致
+    """
+    contacts = await _cached_contacts()
+
+    scores = []
+    # 各联系人的时间聚合列 (weekday, hour, month_idx, count)，最后拼接后一次性交给 numba 内核
+    time_chunks = []
+
+    contacts_to_analyze = contacts if limit <= 0 else contacts[:limit]
+    total_contacts = len(contacts_to_analyze)
+    # 维度预分配为 (N, 4) 连续缓冲区，analyzed_count 即写入游标；
+    # 保持 float64：维度分已保留两位小数，float32 求均值后再 round 会偏差 0.01
+    dims = np.empty((total_contacts, len(_DIM_KEYS)), dtype=np.float64)
+    analyzed_count = 0
+    failed_count = 0
+
+    logger.info("开始综合批量分析 %d 位联系人...", total_contacts)
+
+    # 按块批量读取（每块 BATCH_FETCH_CHUNK 位联系人，预取下一块），块内评分分发到线程池并发执行；
+    # 消息在分发时即从块字典中取出，任务完成后随之释放，峰值内存只与块大小有关，与联系人总数无关
+    loop = asyncio.get_running_loop()
+    user_names = [c["UserName"] for c in contacts_to_analyze]
+    chunk_size = Config.BATCH_FETCH_CHUNK
+
+    def fetch_chunk(start: int):
+        return loop.run_in_executor(executor, _fetch_bulk, user_names[start:start + chunk_size])
+
+    # 按完成顺序逐个产出；汇总仍按联系人原顺序进行，保证同分排序与非流式结果一致
+    results: List = [None] * total_contacts
+    next_fetch = fetch_chunk(0) if total_contacts else None
+    for start in range(0, total_contacts, chunk_size):
+        messages_by_user, times_by_user, fingerprints = await next_fetch
+        next_fetch = fetch_chunk(start + chunk_size) if start + chunk_size < total_contacts else None
+
+        index_of = {}
+        for i, contact in enumerate(contacts_to_analyze[start:start + chunk_size], start):
+            user_name = contact["UserName"]
+            task = loop.run_in_executor(
+                executor,
+                _analyze_one,
+                contact,
+                messages_by_user.pop(user_name, None),
+                times_by_user.pop(user_name, None),
+                fingerprints.get(user_name, ""),
+                i + 1,
+                total_contacts,
+            )
+            index_of[task] = i
+
+        pending = set(index_of)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                item = task.exception() or task.result()
+                results[index_of[task]] = item
+                if isinstance(item, dict):
+                    yield "friend", item["score"]
+
+    for contact, item in zip(contacts_to_analyze, results):
+        if isinstance(item, Exception):
+            logger.warning("分析 %s 时出错: %s", contact.get("DisplayName", "Unknown"), item)
+            failed_count += 1
+            continue
+        if item is None:
+            continue
+
+        scores.append(item["score"])
+        dims[analyzed_count] = item["dim_row"]
+        if item["time_data"] is not None and item["time_data"][0].size:
+            time_chunks.append(item["time_data"])
+        analyzed_count += 1
+
+    # 分数数组只构建一次：稳定降序排序（同分保持原顺序）后继续用于统计
+    arr = np.fromiter((s["score"] for s in scores), dtype=np.float64, count=len(scores))
+    order = np.argsort(-arr, kind="stable")
+    scores = [scores[i] for i in order.tolist()]
+    arr = arr[order]
+    logger.info("批量分析完成！成功: %d, 失败: %d", analyzed_count, failed_count)
+
+    if scores:
+        # 末端 10.0001 使满分 10 落入最后一个区间
+        counts, _ = np.histogram(arr, bins=[0, 2, 4, 6, 8, 10.0001])
+        # arr 已排好序，中位数直接取中间一或两个元素，无需再次 sort/partition
+        n = arr.shape[0]
+        median = (arr[(n - 1) // 2] + arr[n // 2]) / 2
+        statistics = {
+            "average_score": round(float(arr.mean()), 2),
+            "median_score": round(float(median), 2),
+            "score_distribution": dict(zip(["0-2", "2-4", "4-6", "6-8", "8-10"], counts.tolist())),
+        }
+    else:
+        statistics = {
+            "average_score": 0,
+            "median_score": 0,
+            "score_distribution": {"0-2": 0, "2-4": 0, "4-6": 0, "6-8": 0, "8-10": 0},
+        }
+
+    time_analysis = (
+        analyze_time_patterns(*(np.concatenate(cols) for cols in zip(*time_chunks))) if time_chunks else None
+    )
+    relationship_categories = categorize_relationships(scores, arr)
+    dims = dims[:analyzed_count]
+    user_preference = analyze_user_preference(dims, analyzed_count)
+    social_health = calculate_social_health(scores, arr, dims, len(contacts))
+    network_graph = prepare_network_graph_data(scores, arr)
+
+    yield "summary", {
+        "top_friends": scores,
+        "total_contacts": len(contacts),
+        "total_analyzed": analyzed_count,
+        "failed_count": failed_count,
+        "statistics": statistics,
+        "categories": relationship_categories,
+        "user_preference": user_preference,
+        "time_analysis": time_analysis,
+        "social_health": social_health,
+        "network_graph": network_graph,
+    }
+
+
+async def _run_batch(limit: int) -> Dict:
+    """执行一次完整的批量分析，top_friends 为按分数降序的全部好友"""
+    async for kind, payload in _iter_batch(limit):
+        if kind == "summary":
+            return payload
+
+
+def _ndjson_line(kind: str, payload) -> bytes:
+    return orjson.dumps({"type": kind, "data": payload}, option=_ORJSON_OPTIONS) + b"\n"
+
+
+# 批量分析结果缓存：limit -> (写入时间, 结果)；锁保证同一时刻只有一次计算，并发请求共享结果
+_batch_cache: Dict[int, tuple] = {}
+_batch_cache_lock = asyncio.Lock()
+
+
+def _fresh_batch_result(limit: int) -> Optional[Dict]:
+    """TTL 内的缓存结果，过期或不存在时返回 None（调用方需持有 _batch_cache_lock）"""
+    cached = _batch_cache.get(limit)
+    if cached is not None and time.monotonic() - cached[0] < Config.BATCH_CACHE_TTL:
+        return cached[1]
+    return None
+
+
+async def _run_batch_cached(limit: int) -> Dict:
+    """带 TTL 的批量分析，batch_analysis 与 user_preference_analysis 共用"""
+    async with _batch_cache_lock:
+        cached = _fresh_batch_result(limit)
+        if cached is not None:
+            return cached
+
+        result = await _run_batch(limit)
+        _batch_cache[limit] = (time.monotonic(), result)
+        return result
+
+
+# 后台计算任务的强引用（事件循环只持有弱引用，客户端断开后任务仍需跑完并回填缓存）
+_background_tasks: set = set()
+
+
+async def _produce_batch(limit: int, out: asyncio.Queue) -> None:
+    """
+    持 _batch_cache_lock 计算批量分析并回填缓存，逐条放入 out：("friend", score) ...，最后 ("summary", result)；
+    命中缓存时只放入 ("cached", result)，出错时放入 ("error", exc)。只与队列交互，锁的持有时间与客户端读取速度无关
+    """
+    try:
+        async with _batch_cache_lock:
+            result = _fresh_batch_result(limit)
+            if result is not None:
+                out.put_nowait(("cached", result))
+                return
+            async for kind, payload in _iter_batch(limit):
+                if kind == "friend":
+                    out.put_nowait((kind, payload))
+                else:
+                    result = payload
+            _batch_cache[limit] = (time.monotonic(), result)
+        out.put_nowait(("summary", result))
+    except Exception as e:
+        logger.exception("批量分析出错: %s", e)
+        out.put_nowait(("error", e))
+
+
+async def _aiter_batch_ndjson(limit: int):
+    """
+    NDJSON 流：先逐行输出 friend 记录（完成顺序，客户端自行累积/排序），最后一行为 summary
+    （不含 top_friends，避免重复传输）。命中 TTL 缓存时直接按缓存回放，未命中则边算边发并回填缓存；
+    计算在后台任务中持锁进行（与 _run_batch_cached 共用同一把锁，并发请求只计算一次），
+    本生成器只从队列取数据发送，慢速客户端不会阻塞其他批量请求
+    """
+    lines: asyncio.Queue = asyncio.Queue()
+    task = asyncio.create_task(_produce_batch(limit, lines))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+    while True:
+        kind, payload = await lines.get()
+        if kind == "friend":
+            yield _ndjson_line("friend", payload)
+        elif kind == "error":
+            raise payload
+        else:
+            result = payload
+            break
+
+    if kind == "cached":
+        for score in result["top_friends"]:
+            yield _ndjson_line("friend", score)
+
+    summary = {k: v for k, v in result.items() if k != "top_friends"}
+    yield _ndjson_line("summary", summary)
 
 
 # =========================
@@ -545,40 +1088,36 @@ async def root():
     return {"message": "RScore API is running", "version": "1.0.0"}
 
 
-@app.get("/api/contacts", response_model=List[ContactResponse])
+@app.get("/api/contacts", response_class=ORJSONResponse, responses={200: {"model": List[ContactResponse]}})
 async def get_contacts():
-    """获取所有联系人列表"""
+    """获取所有联系人列表（数据来自本地数据库，跳过逐条 Pydantic 校验）"""
     try:
-        contacts = db.get_contacts()
-        return [
-            ContactResponse(
-                user_name=c["UserName"],
-                display_name=c["DisplayName"],
-                nick_name=c.get("NickName"),
-                remark=c.get("Remark"),
-            )
-            for c in contacts
-        ]
+        contacts = await _cached_contacts()
+        return ORJSONResponse(
+            [
+                {
+                    "user_name": c["UserName"],
+                    "display_name": c["DisplayName"],
+                    "nick_name": c.get("NickName"),
+                    "remark": c.get("Remark"),
+                }
+                for c in contacts
+            ]
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/api/calculate_rscore", response_model=RScoreResponse)
+@app.post("/api/calculate_rscore", responses={200: {"model": RScoreResponse}})
 async def calculate_rscore(request: RScoreRequest):
-    """计算关系评分 + 互动分析 + 成就系统"""
+    """计算关系评分 + 互动分析 + 成就系统（结果由内部函数构造，RScoreResponse 仅用于文档，不做运行时校验）"""
     try:
-        messages = db.get_chat_messages(request.user_name)
-        if messages.empty:
+        # 数据库读取与评分均为同步阻塞操作，放到线程中执行以免阻塞事件循环
+        result = await asyncio.to_thread(_build_report, request.user_name)
+        if result is None:
             raise HTTPException(status_code=404, detail="未找到该联系人的聊天记录")
 
-        result = analyzer.calculate_rscore(messages)
-
-        # 新增：互动分析 + 成就
-        inter = _compute_interaction_analysis(messages)
-        result["interaction_analysis"] = inter
-        result["achievements"] = _compute_achievements(messages, inter)
-
-        return RScoreResponse(**result)
+        return NumpyORJSONResponse(result)
     except HTTPException:
         raise
     except Exception as e:
@@ -586,130 +1125,27 @@ async def calculate_rscore(request: RScoreRequest):
 
 
 @app.get("/api/batch_analysis")
-async def batch_analysis(top_n: int = 0, limit: int = 0):
-    """综合批量分析 - 包含所有分析"""
+async def batch_analysis(top_n: int = 0, limit: int = 0, stream: bool = False):
+    """综合批量分析 - 包含所有分析；stream=true 时以 NDJSON 逐条返回（忽略 top_n）"""
+    if stream:
+        return StreamingResponse(_aiter_batch_ndjson(limit), media_type="application/x-ndjson")
     try:
-        contacts = db.get_contacts()
-
-        scores = []
-        all_dimensions = {"interaction": [], "content": [], "emotion": [], "depth": []}
-        all_time_data = []
-
-        contacts_to_analyze = contacts if limit <= 0 else contacts[:limit]
-        total_contacts = len(contacts_to_analyze)
-        analyzed_count = 0
-        failed_count = 0
-
-        print(f"开始综合批量分析 {total_contacts} 位联系人...")
-
-        for i, contact in enumerate(contacts_to_analyze, 1):
-            try:
-                if i % 10 == 0 or i == total_contacts:
-                    print(f"分析进度: {i}/{total_contacts} ({i * 100 / total_contacts:.1f}%)")
-
-                messages = db.get_chat_messages(contact["UserName"])
-                if not messages.empty:
-                    result = analyzer.calculate_rscore(messages)
-                    scores.append(
-                        {
-                            "user_name": contact["UserName"],
-                            "display_name": contact["DisplayName"],
-                            "score": result["total_score"],
-                            "message_count": result["statistics"]["total_messages"],
-                            "days": result["statistics"].get("total_days", 0),
-                            "last_chat": result["statistics"].get("last_chat_date", ""),
-                            "relationship_status": result.get("relationship_status", "未知"),
-                            "freshness": result.get("freshness", 0),
-                            "dimensions": result["dimensions"],
-                        }
-                    )
-
-                    for dim in all_dimensions:
-                        all_dimensions[dim].append(result["dimensions"][dim])
-
-                    # 时间数据（热力图/趋势）
-                    try:
-                        msgs = messages.copy()
-                        if "CreateTime" not in msgs.columns:
-                            msgs["CreateTime"] = pd.to_datetime(messages["CreateTime"], unit="s", errors="coerce")
-                        else:
-                            msgs["CreateTime"] = pd.to_datetime(msgs["CreateTime"], errors="coerce")
-
-                        for _, msg in msgs.iterrows():
-                            if pd.notna(msg["CreateTime"]):
-                                all_time_data.append(
-                                    {
-                                        "weekday": msg["CreateTime"].weekday(),
-                                        "hour": msg["CreateTime"].hour,
-                                        "month": msg["CreateTime"].strftime("%Y-%m"),
-                                        "year": msg["CreateTime"].year,
-                                        "count": 1,
-                                    }
-                                )
-                    except Exception as e:
-                        print(f"处理时间数据时出错: {e}")
-
-                    analyzed_count += 1
-
-            except Exception as e:
-                print(f"分析 {contact.get('DisplayName', 'Unknown')} 时出错: {e}")
-                failed_count += 1
-                continue
-
-        scores.sort(key=lambda x: x["score"], reverse=True)
-        print(f"批量分析完成！成功: {analyzed_count}, 失败: {failed_count}")
-
-        if scores:
-            all_scores = [s["score"] for s in scores]
-            all_scores_sorted = sorted(all_scores)
-            median_index = len(all_scores_sorted) // 2
-            statistics = {
-                "average_score": round(sum(all_scores) / len(all_scores), 2),
-                "median_score": round(all_scores_sorted[median_index], 2) if all_scores_sorted else 0,
-                "score_distribution": {
-                    "0-2": len([s for s in scores if s["score"] < 2]),
-                    "2-4": len([s for s in scores if 2 <= s["score"] < 4]),
-                    "4-6": len([s for s in scores if 4 <= s["score"] < 6]),
-                    "6-8": len([s for s in scores if 6 <= s["score"] < 8]),
-                    "8-10": len([s for s in scores if 8 <= s["score"] <= 10]),
-                },
-            }
-        else:
-            statistics = {
-                "average_score": 0,
-                "median_score": 0,
-                "score_distribution": {"0-2": 0, "2-4": 0, "4-6": 0, "6-8": 0, "8-10": 0},
-            }
-
-        time_analysis = analyze_time_patterns(all_time_data) if all_time_data else None
-        relationship_categories = categorize_relationships(scores)
-        user_preference = analyze_user_preference(all_dimensions, analyzed_count)
-        social_health = calculate_social_health(scores, all_dimensions, len(contacts))
-        network_graph = prepare_network_graph_data(scores)
-
-        return {
-            "top_friends": scores[:top_n] if top_n > 0 else scores,
-            "total_contacts": len(contacts),
-            "total_analyzed": analyzed_count,
-            "failed_count": failed_count,
-            "statistics": statistics,
-            "categories": relationship_categories,
-            "user_preference": user_preference,
-            "time_analysis": time_analysis,
-            "social_health": social_health,
-            "network_graph": network_graph,
-        }
+        result = await _run_batch_cached(limit)
+        # 缓存中的 top_friends 已在 _run_batch 中排好序（一次批量只排一次），取前 top_n 只是 O(k) 切片
+        if top_n > 0:
+            result = {**result, "top_friends": result["top_friends"][:top_n]}
+        return NumpyORJSONResponse(result)
     except Exception as e:
-        print(f"批量分析出错: {e}")
+        logger.exception("批量分析出错: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/api/user_preference_analysis")
 async def user_preference_analysis(limit: int = 30):
-    """独立的用户偏好分析（保持兼容）"""
+    """独立的用户偏好分析（保持兼容），与批量分析共享缓存结果"""
     try:
-        result = await batch_analysis(top_n=0, limit=limit)
-        return result.get("user_preference", {})
+        result = await _run_batch_cached(limit)
+        return NumpyORJSONResponse(result.get("user_preference", {}))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -718,26 +1154,27 @@ async def user_preference_analysis(limit: int = 30):
 async def export_report(user_name: str):
     """导出关系分析报告（包含本次新增两个字段）"""
     try:
-        messages = db.get_chat_messages(user_name)
-        if messages.empty:
+        result = await asyncio.to_thread(_build_report, user_name)
+        if result is None:
             raise HTTPException(status_code=404, detail="未找到该联系人的聊天记录")
 
-        result = analyzer.calculate_rscore(messages)
-        inter = _compute_interaction_analysis(messages)
-        achievements = _compute_achievements(messages, inter)
-        result["interaction_analysis"] = inter
-        result["achievements"] = achievements
-
-        return {"type": "json", "data": result, "export_date": datetime.now().isoformat()}
+        return NumpyORJSONResponse({"type": "json", "data": result, "export_date": datetime.now().isoformat()})
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    """关闭数据库连接"""
+    """关闭线程池、进程池与数据库连接"""
+    if executor:
+        executor.shutdown(wait=False)
+    if process_pool:
+        process_pool.shutdown(wait=False, cancel_futures=True)
     if db:
         db.close()
+    _log_listener.stop()
 
 
 if __name__ == "__main__":
@@ -17,6 +17,10 @@ class Config:
     MICRO_MSG_DB = MSG_DIR / "MicroMsg.db"  # 联系人数据库在Msg目录
     MEDIA_MSG_DB = MSG_DIR / "MediaMsg.db"  # 媒体数据库在Msg目录
 
+    # 连接池配置：每个数据库文件的连接数与 mmap 大小
+    DB_POOL_SIZE = os.cpu_count() or 4
+    DB_MMAP_SIZE = 256 * 1024 * 1024
+
     @classmethod
     def get_msg_databases(cls):
         """动态获取所有MSG数据库文件"""
@@ -59,9 +63,16 @@ class Config:
         float('inf'): 0.4  # 超过一年
     }
 
+    # 日志级别（批量分析进度为 DEBUG 级别，默认不输出）
+    LOG_LEVEL = "INFO"
+
     # API配置
     API_HOST = "0.0.0.0"
     API_PORT = 8000
 
     # 缓存配置
-    CACHE_EXPIRE = 3600  # 1小时
\ No newline at end of file
+    CACHE_EXPIRE = 3600  # 1小时
+    BATCH_CACHE_TTL = 300  # 批量分析结果缓存5分钟
+    CONTACTS_CACHE_TTL = 300  # 联系人列表缓存5分钟
+    BATCH_CONCURRENCY = 16  # 批量分析同时处理的联系人数（线程池大小）
+    BATCH_FETCH_CHUNK = 64  # 批量分析每次读取的联系人数（限制同时驻留内存的聊天记录）
\ No newline at end of file
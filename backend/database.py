@@ -1,16 +1,47 @@
 import sqlite3
-from typing import List, Dict, Any
+import queue
+from itertools import groupby
+from operator import itemgetter
+from contextlib import contextmanager
+from typing import List, Dict, Any, Iterator, Tuple
 from pathlib import Path
+import numpy as np
 import pandas as pd
 from config import Config
 
 
 class WeChatDB:
+    # 消息查询列
+    MSG_COLUMNS = "CreateTime, IsSender, Type, SubType, StrContent, CompressContent, MsgSvrID, StrTalker"
+    # SQLite 单条语句的参数上限（旧版本默认 999）
+    SQLITE_MAX_PARAMS = 999
+    # 流式读取时每次 fetchmany 的行数
+    FETCH_SIZE = 65536
+
     def __init__(self):
         self.config = Config()
-        self.connections = {}
+        # 每个数据库文件一个连接池：库名 -> Queue[sqlite3.Connection]
+        self.pools: Dict[str, queue.Queue] = {}
+        self._all_connections: List[sqlite3.Connection] = []
         self._connect_databases()
 
+    def _open_connection(self, db_path: Path) -> sqlite3.Connection:
+        """打开单个只读用途的连接"""
+        conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        conn.execute(f"PRAGMA mmap_size={self.config.DB_MMAP_SIZE}")
+        conn.execute("PRAGMA query_only=ON")
+        return conn
+
+    def _open_pool(self, name: str, db_path: Path) -> sqlite3.Connection:
+        """为数据库文件建立连接池，返回池中第一个连接供调用方校验"""
+        pool = queue.Queue()
+        connections = [self._open_connection(db_path) for _ in range(self.config.DB_POOL_SIZE)]
+        for conn in connections:
+            pool.put(conn)
+        self._all_connections.extend(connections)
+        self.pools[name] = pool
+        return connections[0]
+
     def _connect_databases(self):
         """连接所有数据库文件"""
         # 获取所有MSG数据库
@@ -21,8 +52,7 @@ class WeChatDB:
         # 连接每个MSG数据库
         for db_path in msg_databases:
             try:
-                conn = sqlite3.connect(str(db_path), check_same_thread=False)
-                self.connections[db_path.name] = conn
+                conn = self._open_pool(db_path.name, db_path)
                 print(f"成功连接: {db_path.name}")
 
                 # 验证是否能读取数据
@@ -37,10 +67,7 @@ class WeChatDB:
         # 连接联系人数据库
         if self.config.MICRO_MSG_DB.exists():
             try:
-                self.connections['MicroMsg'] = sqlite3.connect(
-                    str(self.config.MICRO_MSG_DB),
-                    check_same_thread=False
-                )
+                self._open_pool('MicroMsg', self.config.MICRO_MSG_DB)
                 print(f"成功连接联系人数据库: MicroMsg.db")
             except Exception as e:
                 print(f"连接MicroMsg.db失败: {e}")
@@ -48,68 +75,89 @@ class WeChatDB:
         # 连接媒体数据库
         if self.config.MEDIA_MSG_DB.exists():
             try:
-                self.connections['MediaMsg'] = sqlite3.connect(
-                    str(self.config.MEDIA_MSG_DB),
-                    check_same_thread=False
-                )
+                self._open_pool('MediaMsg', self.config.MEDIA_MSG_DB)
                 print(f"成功连接媒体数据库: MediaMsg.db")
             except Exception as e:
                 print(f"连接MediaMsg.db失败: {e}")
 
+    @contextmanager
+    def acquire(self, db_name: str):
+        """从连接池借出一个连接，用完自动归还；池空时阻塞等待"""
+        pool = self.pools[db_name]
+        conn = pool.get()
+        try:
+            yield conn
+        finally:
+            pool.put(conn)
+
+    def _msg_db_names(self) -> List[str]:
+        """所有MSG数据库名（按连接顺序）"""
+        return [name for name in self.pools if name.startswith('MSG')]
+
+    def warm_up(self):
+        """预热连接池：每个连接执行一次查询，避免首个请求承担初始化开销"""
+        for conn in self._all_connections:
+            try:
+                conn.execute("SELECT 1").fetchone()
+            except Exception as e:
+                print(f"预热连接失败: {e}")
+        print(f"连接池预热完成，共 {len(self._all_connections)} 个连接")
+
     def test_connection(self):
         """测试数据库连接和数据可读性"""
         print("\n=== 数据库连接测试 ===")
 
-        for db_name, conn in self.connections.items():
+        for db_name in self.pools:
             print(f"\n测试 {db_name}:")
             try:
-                cursor = conn.cursor()
-
-                # 获取所有表
-                cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-                tables = cursor.fetchall()
-                print(f"  表数量: {len(tables)}")
-
-                # 如果是MSG数据库，尝试读取一些消息
-                if db_name.startswith('MSG'):
-                    cursor.execute("""
-                        SELECT StrContent, Type, IsSender 
-                        FROM MSG 
-                        WHERE StrContent IS NOT NULL 
-                        LIMIT 3
-                    """)
-                    samples = cursor.fetchall()
-
-                    if samples:
-                        print(f"  示例消息:")
-                        for content, msg_type, is_sender in samples:
-                            sender = "我" if is_sender else "对方"
-                            # 只显示前30个字符
-                            display_content = content[:30] if content else "[无内容]"
-                            print(f"    [{sender}] {display_content}...")
-                    else:
-                        print(f"  未找到文本消息")
-
-                # 如果是联系人数据库
-                elif db_name == 'MicroMsg':
-                    cursor.execute("""
-                        SELECT COUNT(*) 
-                        FROM Contact 
-                        WHERE Type = 3
-                    """)
-                    contact_count = cursor.fetchone()[0]
-                    print(f"  好友数量: {contact_count}")
+                with self.acquire(db_name) as conn:
+                    cursor = conn.cursor()
+
+                    # 获取所有表
+                    cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
+                    tables = cursor.fetchall()
+                    print(f"  表数量: {len(tables)}")
+
+                    # 如果是MSG数据库，尝试读取一些消息
+                    if db_name.startswith('MSG'):
+                        cursor.execute("""
+                            SELECT StrContent, Type, IsSender 
+                            FROM MSG 
+                            WHERE StrContent IS NOT NULL 
+                            LIMIT 3
+                        """)
+                        samples = cursor.fetchall()
+
+                        if samples:
+                            print(f"  示例消息:")
+                            for content, msg_type, is_sender in samples:
+                                sender = "我" if is_sender else "对方"
+                                # 只显示前30个字符
+                                display_content = content[:30] if content else "[无内容]"
+                                print(f"    [{sender}] {display_content}...")
+                        else:
+                            print(f"  未找到文本消息")
+
+                    # 如果是联系人数据库
+                    elif db_name == 'MicroMsg':
+                        cursor.execute("""
+                            SELECT COUNT(*) 
+                            FROM Contact 
+                            WHERE Type = 3
+                        """)
+                        contact_count = cursor.fetchone()[0]
+                        print(f"  好友数量: {contact_count}")
 
             except Exception as e:
                 print(f"  错误: {e}")
 
         print("\n=== 测试完成 ===\n")
 
-        return len(self.connections) > 0
+        return len(self.pools) > 0
 
     def get_contacts(self) -> List[Dict]:
         """获取所有联系人列表"""
-        if 'MicroMsg' not in self.connections:
+        if 'MicroMsg' not in self.pools:
             print("警告: 未找到联系人数据库")
             return []
 
@@ -120,12 +168,14 @@ class WeChatDB:
         ORDER BY NickName
         """
 
-        cursor = self.connections['MicroMsg'].cursor()
-        cursor.execute(query)
-        columns = [desc[0] for desc in cursor.description]
+        with self.acquire('MicroMsg') as conn:
+            cursor = conn.cursor()
+            cursor.execute(query)
+            columns = [desc[0] for desc in cursor.description]
+            rows = cursor.fetchall()
 
         contacts = []
-        for row in cursor.fetchall():
+        for row in rows:
             contact = dict(zip(columns, row))
             # 使用备注名优先，否则使用昵称
             contact['DisplayName'] = contact['Remark'] or contact['NickName'] or contact['UserName']
@@ -134,31 +184,51 @@ class WeChatDB:
         print(f"获取到 {len(contacts)} 个联系人")
         return contacts
 
+    def has_messages(self, talker_id: str) -> bool:
+        """判断是否存在与该联系人的聊天记录（命中一条即返回，不加载消息内容）"""
+        for db_name in self._msg_db_names():
+            try:
+                with self.acquire(db_name) as conn:
+                    cursor = conn.cursor()
+                    cursor.execute("SELECT 1 FROM MSG WHERE StrTalker = ? LIMIT 1", [talker_id])
+                    if cursor.fetchone() is not None:
+                        return True
+            except Exception as e:
+                print(f"从 {db_name} 查询消息失败: {e}")
+
+        return False
+
+    def get_chat_fingerprint(self, talker_id: str) -> str:
+        """获取聊天记录指纹（各MSG库的 MAX(rowid):COUNT(*)），记录有增删时指纹随之变化"""
+        parts = []
+
+        for db_name in self._msg_db_names():
+            try:
+                with self.acquire(db_name) as conn:
+                    cursor = conn.cursor()
+                    cursor.execute("SELECT MAX(rowid), COUNT(*) FROM MSG WHERE StrTalker = ?", [talker_id])
+                    max_rowid, count = cursor.fetchone()
+                parts.append(f"{db_name}={max_rowid or 0}:{count}")
+            except Exception as e:
+                print(f"从 {db_name} 读取指纹失败: {e}")
+
+        return "|".join(parts)
+
     def get_chat_messages(self, talker_id: str) -> pd.DataFrame:
         """获取与特定联系人的所有聊天记录"""
         all_messages = []
 
-        for db_name, conn in self.connections.items():
-            if not db_name.startswith('MSG'):
-                continue
-
-            query = """
-            SELECT 
-                CreateTime,
-                IsSender,
-                Type,
-                SubType,
-                StrContent,
-                CompressContent,
-                MsgSvrID,
-                StrTalker
+        for db_name in self._msg_db_names():
+            query = f"""
+            SELECT {self.MSG_COLUMNS}
             FROM MSG 
             WHERE StrTalker = ?
             ORDER BY CreateTime
             """
 
             try:
-                df = pd.read_sql_query(query, conn, params=[talker_id])
+                with self.acquire(db_name) as conn:
+                    df = pd.read_sql_query(query, conn, params=[talker_id])
                 if not df.empty:
                     all_messages.append(df)
                     print(f"从 {db_name} 获取到 {len(df)} 条消息")
@@ -172,9 +242,135 @@ class WeChatDB:
 
         return pd.DataFrame()
 
+    def get_chat_times_bulk(self, talker_ids: List[str]) -> Dict[str, np.ndarray]:
+        """批量读取多个联系人的消息时间戳，返回 {联系人: 升序 int64 数组}，无记录的联系人不出现在结果中"""
+        frames: Dict[str, List[np.ndarray]] = {}
+
+        for db_name in self._msg_db_names():
+            for start in range(0, len(talker_ids), self.SQLITE_MAX_PARAMS):
+                chunk = talker_ids[start:start + self.SQLITE_MAX_PARAMS]
+                placeholders = ",".join("?" * len(chunk))
+                query = f"""
+                SELECT StrTalker, CreateTime
+                FROM MSG
+                WHERE StrTalker IN ({placeholders}) AND CreateTime IS NOT NULL
+                ORDER BY StrTalker, CreateTime
+                """
+                # 先读完本次查询再并入结果，中途出错时不留下残缺数据
+                fetched = []
+                try:
+                    with self.acquire(db_name) as conn:
+                        for talker, rows in self._iter_talker_rows(conn.execute(query, chunk), 0):
+                            fetched.append((talker, np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows))))
+                except Exception as e:
+                    print(f"从 {db_name} 批量读取消息时间失败: {e}")
+                    continue
+
+                for talker, times in fetched:
+                    frames.setdefault(talker, []).append(times)
+
+        return {talker: np.sort(np.concatenate(parts)) for talker, parts in frames.items() if parts}
+
+    def get_chat_fingerprints_bulk(self, talker_ids: List[str]) -> Dict[str, str]:
+        """批量获取聊天记录指纹，格式与 get_chat_fingerprint 完全一致（可共用同一份评分缓存）"""
+        stats = {db_name: {} for db_name in self._msg_db_names()}
+
+        for db_name in stats:
+            for start in range(0, len(talker_ids), self.SQLITE_MAX_PARAMS):
+                chunk = talker_ids[start:start + self.SQLITE_MAX_PARAMS]
+                placeholders = ",".join("?" * len(chunk))
+                query = f"""
+                SELECT StrTalker, MAX(rowid), COUNT(*)
+                FROM MSG
+                WHERE StrTalker IN ({placeholders})
+                GROUP BY StrTalker
+                """
+                try:
+                    with self.acquire(db_name) as conn:
+                        cursor = conn.cursor()
+                        cursor.execute(query, chunk)
+                        for talker, max_rowid, count in cursor.fetchall():
+                            stats[db_name][talker] = (max_rowid, count)
+                except Exception as e:
+                    print(f"从 {db_name} 批量读取指纹失败: {e}")
+
+        fingerprints = {}
+        for talker in talker_ids:
+            parts = []
+            for db_name, per_talker in stats.items():
+                max_rowid, count = per_talker.get(talker, (0, 0))
+                parts.append(f"{db_name}={max_rowid or 0}:{count}")
+            fingerprints[talker] = "|".join(parts)
+        return fingerprints
+
+    def _iter_talker_rows(self, cursor: sqlite3.Cursor, talker_index: int) -> Iterator[Tuple[str, List[tuple]]]:
+        """
+        单游标流式读取按 StrTalker 排序的查询结果（talker_index 为 StrTalker 所在列），
+        联系人切换时产出该联系人的全部行，避免先构建整块 DataFrame 再 groupby 拷贝一遍
+        """
+        talker_of = itemgetter(talker_index)
+        current, buffer = None, []
+
+        while True:
+            rows = cursor.fetchmany(self.FETCH_SIZE)
+            if not rows:
+                break
+            # 同一联系人的记录可能跨越两次 fetchmany，故在切换时才产出
+            for talker, group in groupby(rows, key=talker_of):
+                if talker != current:
+                    if buffer:
+                        yield current, buffer
+                    current, buffer = talker, []
+                buffer.extend(group)
+
+        if buffer:
+            yield current, buffer
+
+    def _iter_talker_frames(self, conn: sqlite3.Connection, query: str, params: List) -> Iterator[Tuple[str, pd.DataFrame]]:
+        """同 _iter_talker_rows，按联系人产出 DataFrame"""
+        cursor = conn.execute(query, params)
+        columns = [desc[0] for desc in cursor.description]
+        for talker, rows in self._iter_talker_rows(cursor, columns.index('StrTalker')):
+            yield talker, pd.DataFrame.from_records(rows, columns=columns)
+
+    def get_chat_messages_bulk(self, talker_ids: List[str]) -> Dict[str, pd.DataFrame]:
+        """
+        批量获取多个联系人的聊天记录：每个MSG库按 IN 分块（受 SQLite 参数上限约束）各查询一次，
+        以 StrTalker, CreateTime 排序后单游标流式切分，返回 {联系人: DataFrame}，无记录的联系人不出现在结果中
+        """
+        frames: Dict[str, List[pd.DataFrame]] = {}
+
+        for db_name in self._msg_db_names():
+            for start in range(0, len(talker_ids), self.SQLITE_MAX_PARAMS):
+                chunk = talker_ids[start:start + self.SQLITE_MAX_PARAMS]
+                placeholders = ",".join("?" * len(chunk))
+                query = f"""
+                SELECT {self.MSG_COLUMNS}
+                FROM MSG
+                WHERE StrTalker IN ({placeholders})
+                ORDER BY StrTalker, CreateTime
+                """
+                total = 0
+                try:
+                    with self.acquire(db_name) as conn:
+                        for talker, df in self._iter_talker_frames(conn, query, chunk):
+                            frames.setdefault(talker, []).append(df)
+                            total += len(df)
+                except Exception as e:
+                    print(f"从 {db_name} 批量读取消息失败: {e}")
+                    continue
+
+                print(f"从 {db_name} 批量获取到 {total} 条消息")
+
+        # 与 get_chat_messages 相同：跨库拼接后按时间排序
+        return {
+            talker: pd.concat(parts, ignore_index=True).sort_values('CreateTime')
+            for talker, parts in frames.items()
+        }
+
     def close(self):
         """关闭所有数据库连接"""
-        for conn in self.connections.values():
+        for conn in self._all_connections:
             conn.close()
         print("所有数据库连接已关闭")
 
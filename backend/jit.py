@@ -0,0 +1,13 @@
+# 尝试导入numba：评分与批量汇总的数值内核共用，未安装时退化为纯Python
+try:
+    from numba import njit
+
+    print("✓ Numba已安装，数值内核将JIT编译")
+except ImportError:
+    print("⚠ Numba未安装，数值内核以纯Python运行")
+
+    def njit(*args, **kwargs):
+        """未安装numba时的占位装饰器，原样返回函数"""
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func